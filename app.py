@@ -4,16 +4,36 @@ import logging
 import json
 import re
 import pickle
+import random
+import time
+import hashlib
+import uuid
+from urllib.parse import urlparse
 import numpy as np
 import torch  # <--- CHANGED: Use PyTorch
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, session, abort
 from transformers import BertForSequenceClassification # <--- CHANGED: PyTorch Model
 
+# Optional: WebSocket chat channel (pip install flask-sock). HTTP /chat works without it.
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
+
 # Import Logic
-from logic import CourseRepository, ContextManager, AcademicAdvisor
+from logic import CourseRepository, ContextManager, AcademicAdvisor, ResponseCache, AdmissionController
+from conversation_log import ConversationLogger
+from profiling import RequestProfiler
 
 app = Flask(__name__)
-app.secret_key = "gju_super_secret"
+# Signs the session cookie that carries the ContextManager session id: must stay private
+app.secret_key = os.getenv("SECRET_KEY")
+if not app.secret_key:
+    app.secret_key = os.urandom(32)
+    print("⚠️ SECRET_KEY not set. Using a random key, sessions won't survive a restart.")
+# Don't send the session cookie along with cross-site requests (incl. WebSocket handshakes)
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 # ==============================================================================
 # 🧠 AI & MODEL LOADING
@@ -28,73 +48,207 @@ tokenizer = pickle.load(open("tokenizer.pkl", "rb"))
 encoder = pickle.load(open("label_encoder.pkl", "rb"))
 
 # Load Model (PyTorch)
+# Point INTENT_MODEL_DIR at bert_student_model to serve the distilled student
+MODEL_DIR = os.getenv("INTENT_MODEL_DIR", "bert_intent_model")
 try:
-    model = BertForSequenceClassification.from_pretrained("bert_intent_model")
+    model = BertForSequenceClassification.from_pretrained(MODEL_DIR)
     model.eval() # Set to eval mode
-    print("✅ BERT Model (PyTorch) Loaded Successfully.")
+    print(f"✅ BERT Model (PyTorch) Loaded Successfully from {MODEL_DIR}.")
 except Exception as e:
     print(f"❌ Error loading BERT model: {e}")
     sys.exit(1)
 
 CONFIDENCE_THRESHOLD = 0.45
 
+# --- Retrieval Index (built by train_model.py) ---
+# The cutoff is calibrated per model by train_model.py and stored in pattern_index.json
+pattern_matrix, pattern_tags = None, []
+try:
+    with open(os.path.join(MODEL_DIR, "pattern_index.json"), "r", encoding="utf-8") as f:
+        index_meta = json.load(f)
+    with open(os.path.join(MODEL_DIR, "pattern_tags.json"), "r", encoding="utf-8") as f:
+        index_tags = json.load(f)
+    index_matrix = np.load(os.path.join(MODEL_DIR, "pattern_embeddings.npy"), mmap_mode="r")
+
+    # A stale index would quietly answer with the wrong tags
+    classes = [str(c) for c in encoder.classes_]
+    if index_meta.get("classes") != classes or not set(index_tags) <= set(classes) or len(index_tags) != index_matrix.shape[0]:
+        print("⚠️ Pattern index does not match label_encoder.pkl. Rebuild it with `python train_model.py --build-index`.")
+    elif index_meta.get("threshold") is None:
+        print("⚠️ Pattern index has no calibrated cutoff; retrieval tier disabled.")
+    else:
+        pattern_matrix, pattern_tags = index_matrix, index_tags
+        RETRIEVAL_TOP_K = index_meta["top_k"]
+        RETRIEVAL_THRESHOLD = index_meta["threshold"]
+        print(f"✅ Pattern index loaded ({len(pattern_tags)} patterns, cutoff {RETRIEVAL_THRESHOLD:.3f}).")
+except FileNotFoundError:
+    print("⚠️ No pattern index found. Run `python train_model.py --build-index` to enable retrieval.")
+
+# --- Early-Exit Heads (train_model.py writes them after every training run) ---
+# Set EARLY_EXIT=0 to always run every encoder layer
+WEIGHTS_FILES = ["model.safetensors", "pytorch_model.bin"]
+
+def model_fingerprint(model_dir, classes):
+    """Must match train_model.model_fingerprint"""
+    weights = next(os.path.join(model_dir, n) for n in WEIGHTS_FILES if os.path.exists(os.path.join(model_dir, n)))
+    with open(weights, "rb") as f:
+        weights_hash = hashlib.sha256(f.read()).hexdigest()
+    return hashlib.sha256(f"{weights_hash}|{','.join(str(c) for c in classes)}".encode()).hexdigest()
+
+exit_heads, exit_thresholds = {}, {}
+if os.getenv("EARLY_EXIT", "1") != "0":
+    try:
+        exit_ckpt = torch.load(os.path.join(MODEL_DIR, "early_exit.pt"))
+        # Heads trained on another backbone would exit early, confidently, with the wrong intent
+        if exit_ckpt.get("fingerprint") != model_fingerprint(MODEL_DIR, encoder.classes_):
+            print("⚠️ Early-exit heads do not match this model. Retrain them with `python train_model.py --early-exit`.")
+        else:
+            for layer in exit_ckpt["exit_layers"]:
+                head = torch.nn.Linear(model.config.hidden_size, model.config.num_labels)
+                head.load_state_dict(exit_ckpt["heads"][layer])
+                head.eval()
+                exit_heads[layer] = head
+                # Never exit below the threshold the full model has to clear
+                exit_thresholds[layer] = max(exit_ckpt["thresholds"][layer], CONFIDENCE_THRESHOLD)
+            print(f"✅ Early-exit heads loaded (layers {sorted(exit_heads)}).")
+    except FileNotFoundError:
+        print("⚠️ No early-exit heads found. Running the full encoder for every message.")
+
+metrics = {"bert_calls": 0, "bert_layers": 0, "early_exits": 0}
+
 def clean_text(text):
     text = text.lower()
     text = re.sub(r"[^a-z0-9\s]", "", text)
     return text.strip()
 
-def predict_intent(text):
+def retrieve_intent(query_vec):
+    """Top-k cosine vote of the query against every intents.json pattern"""
+    query_vec = query_vec / (np.linalg.norm(query_vec) + 1e-9)
+    sims = pattern_matrix @ query_vec
+    k = min(RETRIEVAL_TOP_K, len(sims))
+    top = np.argpartition(-sims, k - 1)[:k]
+
+    votes = {}
+    for i in top:
+        votes[pattern_tags[i]] = votes.get(pattern_tags[i], 0.0) + float(sims[i])
+    tag = max(votes, key=votes.get)
+    best = max(float(sims[i]) for i in top if pattern_tags[i] == tag)
+
+    # Need a close neighbour AND a clear majority among the top-k
+    if best >= RETRIEVAL_THRESHOLD and votes[tag] > 0.5 * sum(votes.values()):
+        return tag, best
+    return None, best
+
+def run_bert(inputs):
+    """
+    Forward pass layer by layer, stopping at the first exit head that is
+    confident enough. Returns (probs, last hidden state or None if we exited).
+    """
+    bert = model.bert
+    hidden = bert.embeddings(input_ids=inputs["input_ids"], token_type_ids=inputs.get("token_type_ids"))
+    ext_mask = model.get_extended_attention_mask(inputs["attention_mask"], inputs["input_ids"].shape)
+
+    metrics["bert_calls"] += 1
+    for i, layer_module in enumerate(bert.encoder.layer, start=1):
+        out = layer_module(hidden, attention_mask=ext_mask)
+        hidden = out[0] if isinstance(out, tuple) else out
+        metrics["bert_layers"] += 1
+
+        if i in exit_heads:
+            probs = torch.nn.functional.softmax(exit_heads[i](hidden[:, 0]), dim=1)
+            if probs.max().item() >= exit_thresholds[i]:
+                metrics["early_exits"] += 1
+                return probs, None
+
+    logits = model.classifier(bert.pooler(hidden))
+    return torch.nn.functional.softmax(logits, dim=1), hidden
+
+def bert_predict(clean_input):
+    """Layers 2 & 3. Returns (tag, confidence, tier) or (None, confidence, None) if unsure."""
+    # --- [LAYER 2] BERT Prediction (PyTorch) ---
+    inputs = tokenizer(clean_input, return_tensors="pt") # "pt" for PyTorch
+    
+    with torch.no_grad(), profiler.stage("bert"):
+        if exit_heads:
+            probs, last_hidden = run_bert(inputs)
+        else:
+            outputs = model(**inputs, output_hidden_states=pattern_matrix is not None)
+            probs = torch.nn.functional.softmax(outputs.logits, dim=1)
+            last_hidden = outputs.hidden_states[-1] if pattern_matrix is not None else None
+            metrics["bert_calls"] += 1
+            metrics["bert_layers"] += model.config.num_hidden_layers
+    
+    confidence = probs.max().item()
+    idx = probs.argmax().item()
+    tag = encoder.inverse_transform([idx])[0]
+
+    if confidence >= CONFIDENCE_THRESHOLD:
+        exited_early = bool(exit_heads) and last_hidden is None
+        return tag, confidence, 'early_exit' if exited_early else 'bert'
+
+    # --- [LAYER 3] Nearest-Neighbour Retrieval (reuses the BERT hidden state) ---
+    if pattern_matrix is not None and last_hidden is not None:
+        with profiler.stage("retrieval"):
+            query_vec = last_hidden[0].mean(dim=0).numpy()
+            retrieved_tag, score = retrieve_intent(query_vec)
+        # A retrieved 'unknown' is no answer: let the keyword fallback have a go
+        if retrieved_tag and retrieved_tag != 'unknown':
+            return retrieved_tag, score, 'retrieval'
+
+    return None, confidence, None
+
+def predict_intent(text, use_bert=True):
+    tag, confidence, _ = predict_intent_with_tier(text, use_bert)
+    return tag, confidence
+
+def predict_intent_with_tier(text, use_bert=True):
+    """Same as predict_intent, plus which tier answered (for the conversation log)"""
     text_lower = text.lower()
     
     # --- [LAYER 1] Hybrid Rules (The "Reflexes") ---
     # Restore these to catch "Can I take" and "Dr Ismail" accurately
     
     if "prereq" in text_lower or "pre-req" in text_lower:
-        return 'ask_prereqs', 1.0
+        return 'ask_prereqs', 1.0, 'rules'
         
     if "can i take" in text_lower or "eligible" in text_lower:
-        return 'check_eligibility', 1.0
+        return 'check_eligibility', 1.0, 'rules'
 
     if "who teaches" in text_lower or "professor" in text_lower or "instructor" in text_lower or "office" in text_lower or "where is dr" in text_lower or "dr." in text_lower:
-        return 'ask_instructor_info', 1.0
+        return 'ask_instructor_info', 1.0, 'rules'
         
     if any(w in text_lower for w in ["joke", "laugh", "funny", "humor"]):
-        return 'humor', 1.0
+        return 'humor', 1.0, 'rules'
         
     if any(w in text_lower for w in ["hi", "hello", "hey", "greetings"]):
-        return 'greeting', 1.0
+        return 'greeting', 1.0, 'rules'
         
     if any(w in text_lower for w in ["bye", "goodbye", "quit", "exit"]):
-        return 'goodbye', 1.0
+        return 'goodbye', 1.0, 'rules'
 
     if text_lower in ["yes", "yep", "yeah", "sure", "ok", "please"]:
-        return 'affirm', 1.0
+        return 'affirm', 1.0, 'rules'
         
     if text_lower in ["no", "nope", "nah", "cancel"]:
-        return 'deny', 1.0
+        return 'deny', 1.0, 'rules'
 
-    # --- [LAYER 2] BERT Prediction (PyTorch) ---
     clean_input = clean_text(text)
-    inputs = tokenizer(clean_input, return_tensors="pt") # "pt" for PyTorch
-    
-    with torch.no_grad():
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits, dim=1)
-    
-    confidence = probs.max().item()
-    idx = probs.argmax().item()
-    tag = encoder.inverse_transform([idx])[0]
+    confidence = 0.0
 
-    if confidence >= CONFIDENCE_THRESHOLD:
-        return tag, confidence
+    # --- [LAYER 2 + 3] BERT & Retrieval (skipped when the server is degraded) ---
+    if use_bert:
+        with admission.bert_slot() as acquired:
+            if acquired:
+                tag, confidence, tier = bert_predict(clean_input)
+                if tag: return tag, confidence, tier
 
     # Fallback: Exact Keyword Match
     for intent in intents:
         for pattern in intent["patterns"]:
             if clean_text(pattern) in clean_input:
-                return intent["tag"], 0.99
+                return intent["tag"], 0.99, 'keyword'
 
-    return "unknown", confidence
+    return "unknown", confidence, 'unknown'
 
 
 # ==============================================================================
@@ -104,6 +258,7 @@ def predict_intent(text):
 repo = CourseRepository()
 ctx_mgr = ContextManager()
 advisor = AcademicAdvisor(repo)
+response_cache = ResponseCache(max_size=int(os.getenv("RESPONSE_CACHE_SIZE", 512)))
 
 
 def handle_intent(user_id, text, intent_tag, confidence):
@@ -178,9 +333,15 @@ def handle_intent(user_id, text, intent_tag, confidence):
     # Case 1: Instructor Info (Handle separately to fix "Which course?" bug)
    # Case 1: Instructor Info (Check this FIRST)
     if intent_tag == 'ask_instructor_info':
+        search_key = " ".join(repo.instructor_search_terms(text))
+        cached = response_cache.get(intent_tag, search_key)
+        if cached: return cached
+
         instructor = repo.fuzzy_find_instructor(text)
         if instructor:
-            return f"👨‍🏫 **{instructor['name']}**\nOffice: {instructor['office_location']}\nEmail: {instructor['email']}\nPhone: {instructor['phone']}"
+            response = f"👨‍🏫 **{instructor['name']}**\nOffice: {instructor['office_location']}\nEmail: {instructor['email']}\nPhone: {instructor['phone']}"
+            response_cache.put(intent_tag, search_key, response)
+            return response
         
         # Only if no instructor is found, check if they meant a course
         target = detected_course if detected_course else last_course
@@ -200,17 +361,26 @@ def handle_intent(user_id, text, intent_tag, confidence):
             ctx['pending_intent'] = intent_tag 
             return "Which course are you asking about? (e.g., CS116)"
         
+        # Catalog-only answers: served from cache until load_data.py bumps the version
+        # (only found results are cached so a DB outage never gets stuck in the cache)
+        cached = response_cache.get(intent_tag, target)
+        if cached: return cached
+
         if intent_tag == 'ask_course_info':
             details = repo.get_course_details(target)
             if details:
-                return f"📘 **{details['course_code']}**\n{details['course_name']}\n{details['description']}\nCredits: {details['credit_hours']}"
+                response = f"📘 **{details['course_code']}**\n{details['course_name']}\n{details['description']}\nCredits: {details['credit_hours']}"
+                response_cache.put(intent_tag, target, response)
+                return response
             return f"I couldn't find details for {target}."
             
         if intent_tag == 'ask_prereqs':
             prereqs = repo.get_prerequisites(target)
             if prereqs:
                 p_list = ", ".join([f"{p[0]} ({p[1]})" for p in prereqs])
-                return f"🔗 **Prerequisites for {target}**:\n{p_list}"
+                response = f"🔗 **Prerequisites for {target}**:\n{p_list}"
+                response_cache.put(intent_tag, target, response)
+                return response
             return f"**{target}** has no prerequisites."
 
     # Case 3: Eligibility
@@ -265,25 +435,213 @@ def handle_intent(user_id, text, intent_tag, confidence):
     # Fallback from JSON
     for intent in intents:
         if intent['tag'] == intent_tag:
-            import random
             return random.choice(intent['responses'])
     
     return "I'm listening, but I'm not sure how to help with that specifically."
 
+# ==============================================================================
+# 🚦 ADMISSION CONTROL
+# ==============================================================================
+
+admission = AdmissionController(
+    rules_only_at=int(os.getenv("ADMIT_RULES_ONLY_AT", 8)),
+    cache_only_at=int(os.getenv("ADMIT_CACHE_ONLY_AT", 16)),
+    shed_at=int(os.getenv("ADMIT_SHED_AT", 32)),
+    bert_queue_at=int(os.getenv("ADMIT_BERT_QUEUE_AT", 4)),
+    bert_concurrency=int(os.getenv("BERT_CONCURRENCY", 2)),
+    bert_wait=float(os.getenv("BERT_WAIT_SECONDS", 0.5)),
+)
+RETRY_AFTER_SECONDS = 2
+BUSY_MESSAGE = "⏳ I'm handling a lot of questions right now. Please try again in a few seconds."
+
+# Intents whose answer needs the DB (or a multi-turn flow) and can't be served from cache
+DB_INTENTS = {'ask_course_info', 'ask_prereqs', 'ask_instructor_info', 'check_eligibility', 'make_schedule', 'request_advice', 'graduation_check'}
+
+def cached_answer(user_id, text, intent_tag):
+    """Cache-only mode: cached catalog answers or static replies, never the DB"""
+    ctx = ctx_mgr.get_context(user_id)
+    # Mid-flow turns (waiting_for_*) need handle_intent, which may hit the DB
+    if ctx['status'] != 'idle':
+        return None
+
+    # Keep the entity memory in step with handle_intent
+    detected_course = repo.normalize_code(text)
+    if detected_course and len(detected_course) > 3:
+        ctx_mgr.set_last_entity(user_id, 'course', detected_course)
+
+    if intent_tag in ('ask_course_info', 'ask_prereqs'):
+        target = detected_course or ctx_mgr.get_last_entity(user_id)['value']
+        return response_cache.get(intent_tag, target) if target else None
+    if intent_tag == 'ask_instructor_info':
+        return response_cache.get(intent_tag, " ".join(repo.instructor_search_terms(text)))
+    if intent_tag in DB_INTENTS:
+        return None
+    for intent in intents:
+        if intent['tag'] == intent_tag:
+            return random.choice(intent['responses'])
+    return None
+
+# ==============================================================================
+# 📝 CONVERSATION LOG (replay with replay.py)
+# ==============================================================================
+
+# Set CONVERSATION_LOG=0 to disable
+conv_log = ConversationLogger(log_dir=os.getenv("CONVERSATION_LOG_DIR", "logs")) if os.getenv("CONVERSATION_LOG", "1") != "0" else None
+
+def log_turn(user_id, msg, tag, conf, tier, started):
+    if not conv_log: return
+    ctx = ctx_mgr.sessions.get(user_id)
+    conv_log.log(
+        # Hashed so logs keep sessions apart without storing client addresses
+        session=hashlib.sha1(str(user_id).encode()).hexdigest()[:12],
+        message=msg,
+        tag=tag,
+        confidence=round(float(conf), 4) if conf is not None else None,
+        tier=tier,
+        latency_ms=round((time.perf_counter() - started) * 1000, 2),
+        status=ctx['status'] if ctx else None,
+    )
+
+# ==============================================================================
+# 🔬 PROFILING (opt-in)
+# ==============================================================================
+# Deep profiles for a request: send header X-Profile-Token: $PROFILE_TOKEN,
+# or set PROFILE_SAMPLE_RATE (e.g. 0.01). Files go to PROFILE_DIR.
+# GET /admin/slow (same header) lists recent slow requests with their stages.
+# The token is only read from headers, never the query string (access logs).
+# /ws: send the header on the handshake (non-browser clients) to profile every turn.
+
+profiler = RequestProfiler(
+    out_dir=os.getenv("PROFILE_DIR", "profiles"),
+    token=os.getenv("PROFILE_TOKEN") or None,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    slow_ms=float(os.getenv("SLOW_REQUEST_MS", 500)),
+)
+
+def busy_response():
+    return jsonify({"response": BUSY_MESSAGE, "retry_after": RETRY_AFTER_SECONDS}), 503, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
+def get_session_id():
+    """One ContextManager session per browser (cookie), not per IP: students behind NAT share an address"""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
+
 @app.route("/")
 def index():
+    get_session_id() # Set the cookie now so the WebSocket handshake already carries it
     return render_template("index.html")
 
+def process_message(user_id, msg, profile=False):
+    """Shared by /chat and /ws. Returns (response, busy)."""
+    with profiler.request(msg, profile=profile) as record:
+        response, busy, tag, tier = answer_message(user_id, msg)
+        record.update(tag=tag, tier=tier)
+    return response, busy
+
+def answer_message(user_id, msg):
+    started = time.perf_counter()
+    level = admission.admit()
+    if level == AdmissionController.SHED:
+        log_turn(user_id, msg, None, None, 'shed', started)
+        return BUSY_MESSAGE, True, None, 'shed'
+
+    try:
+        if level == AdmissionController.CACHE_ONLY:
+            with profiler.stage("predict"):
+                tag, conf, tier = predict_intent_with_tier(msg, use_bert=False)
+            response = cached_answer(user_id, msg, tag)
+            if response is None:
+                admission.count("cache_only_misses")
+                log_turn(user_id, msg, tag, conf, 'cache_miss', started)
+                return BUSY_MESSAGE, True, tag, 'cache_miss'
+            tier = 'cache'
+        else:
+            with profiler.stage("predict"):
+                tag, conf, tier = predict_intent_with_tier(msg, use_bert=(level == AdmissionController.FULL))
+            with profiler.stage("handle"):
+                response = handle_intent(user_id, msg, tag, conf)
+    finally:
+        admission.release()
+    log_turn(user_id, msg, tag, conf, tier, started)
+    return response, False, tag, tier
+
 @app.route("/chat", methods=['POST'])
 def chat():
-    user_id = request.remote_addr
+    user_id = get_session_id()
     data = request.json
     msg = data.get('message', '')
     if not msg: return jsonify({"response": "Empty message."})
-    
-    tag, conf = predict_intent(msg)
-    response = handle_intent(user_id, msg, tag, conf)
+
+    want_profile = profiler.should_profile(request.headers.get("X-Profile-Token"))
+    response, busy = process_message(user_id, msg, profile=want_profile)
+    if busy:
+        return busy_response()
     return jsonify({"response": response})
 
+# ==============================================================================
+# 🔌 WEBSOCKET CHANNEL
+# ==============================================================================
+# Client -> server: one plain-text frame per message (pipelined, no HTTP per turn)
+# Server -> client: JSON frames, answered in the order messages arrive
+#   {"type": "response", "response": ...}
+#   {"type": "busy", "response": ..., "retry_after": n}
+#   {"type": "error", "response": ...}   e.g. for binary frames
+
+if Sock:
+    app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25}
+    sock = Sock(app)
+
+    @app.before_request
+    def check_ws_origin():
+        # Browsers always send Origin on a WebSocket handshake. Refuse other sites'
+        # pages before the upgrade, or they could drive a student's session.
+        if request.path != "/ws": return
+        origin = request.headers.get("Origin")
+        if origin and urlparse(origin).netloc != request.host:
+            abort(403)
+
+    @sock.route("/ws")
+    def chat_ws(ws):
+        # Bind the session at connect, only from the signed cookie index() set.
+        # Without one, this connection gets a throwaway session (the handshake can't set cookies).
+        sid = session.get('sid') or uuid.uuid4().hex
+        admin = profiler.is_admin(request.headers.get("X-Profile-Token"))
+
+        try:
+            while True:
+                msg = ws.receive()
+                if msg is None: break
+                if not isinstance(msg, str):
+                    ws.send(json.dumps({"type": "error", "response": "Only text messages are supported."}))
+                    continue
+                msg = msg.strip()
+                if not msg: continue
+                response, busy = process_message(sid, msg, profile=admin or profiler.should_profile())
+                if busy:
+                    ws.send(json.dumps({"type": "busy", "response": response, "retry_after": RETRY_AFTER_SECONDS}))
+                else:
+                    ws.send(json.dumps({"type": "response", "response": response}))
+        except ConnectionClosed:
+            pass
+
+@app.route("/metrics")
+def get_metrics():
+    calls = metrics["bert_calls"]
+    return jsonify({
+        **metrics,
+        "avg_layers": metrics["bert_layers"] / calls if calls else 0.0,
+        "num_layers": model.config.num_hidden_layers,
+        "catalog_cache": response_cache.stats(),
+        "admission": admission.stats(),
+        "conversation_log": conv_log.stats() if conv_log else None,
+    })
+
+@app.route("/admin/slow")
+def slow_requests():
+    if not profiler.is_admin(request.headers.get("X-Profile-Token")):
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify({"slow_ms": profiler.slow_ms, "requests": profiler.recent_slow()})
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger("ConversationLog")
+
+
+class ConversationLogger:
+    """
+    Non-blocking JSONL conversation log. /chat only does a put_nowait() on a
+    bounded queue; a background thread drains it in batches and rotates the
+    file by size. When the buffer is full, entries are dropped (and counted)
+    instead of slowing down the request.
+    """
+    def __init__(self, log_dir="logs", filename="conversations.jsonl", max_queue=10000,
+                 batch_size=100, flush_interval=1.0, max_bytes=50 * 1024 * 1024, backups=5):
+        self.path = os.path.join(log_dir, filename)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.lock = threading.Lock()  # Counters are updated from request threads and the writer
+        self._stop = threading.Event()
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, **entry):
+        entry.setdefault("ts", time.time())
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _drain(self):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self._rotate_if_needed()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch))
+            with self.lock:
+                self.written += len(batch)
+        except OSError as err:
+            with self.lock:
+                self.dropped += len(batch)
+            logger.error(f"Conversation log write failed: {err}")
+
+    def _rotate_if_needed(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.max_bytes:
+            return
+        # conversations.jsonl -> .1 -> .2 ... oldest beyond `backups` is removed
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        with self.lock:
+            return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+def read_logs(path):
+    """Yield entries from a log file and its rotated siblings, oldest first"""
+    log_dir, base = os.path.split(path)
+    if not os.path.isdir(log_dir or "."):
+        return
+    rotated = [p for p in os.listdir(log_dir or ".") if p.startswith(base + ".") and p.rsplit(".", 1)[-1].isdigit()]
+    rotated.sort(key=lambda p: int(p.rsplit(".", 1)[-1]), reverse=True)
+    files = [os.path.join(log_dir, p) for p in rotated] + [path]
+    for file in files:
+        if not os.path.exists(file):
+            continue
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -1,4 +1,6 @@
 import json
+import os
+import time
 import mysql.connector
 import sys
 
@@ -10,6 +12,17 @@ DB_CONFIG = {
     'database': 'chatbot_db'
 }
 
+# Read by logic.ResponseCache in app.py; bumping it drops cached catalog answers
+CATALOG_VERSION_FILE = 'catalog_version.json'
+
+def bump_catalog_version():
+    version = int(time.time() * 1000)
+    tmp_path = CATALOG_VERSION_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version}, f)
+    os.replace(tmp_path, CATALOG_VERSION_FILE)  # Atomic, so readers never see a half-written file
+    print(f"♻️ Catalog version bumped to {version}")
+
 def get_db_connection():
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -65,6 +78,7 @@ def load_data():
         cursor.execute("SET FOREIGN_KEY_CHECKS=1;")
         conn.commit()
         print("✅ Data loaded successfully!")
+        bump_catalog_version()
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,236 @@
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+import http.cookiejar
+from collections import defaultdict
+
+# ===================================================================
+# CONVERSATIONAL LOAD GENERATOR for /chat
+# ===================================================================
+# Simulated students (a fresh cookie session per flow) walk through scripted and
+# randomized multi-turn flows built from intents.json and gju_data.json,
+# while concurrency ramps up stage by stage.
+#
+#   python loadgen.py --url http://127.0.0.1:5000 --ramp 1,5,10,20 --stage-seconds 30
+
+TRACKS = ["General", "Data Science", "Cybersecurity"]
+
+# ===================================================================
+# 1. CORPUS
+# ===================================================================
+
+def load_corpus(intents_path="intents.json", catalog_path="gju_data.json"):
+    with open(intents_path, "r", encoding="utf-8") as f:
+        patterns = {i["tag"]: i["patterns"] for i in json.load(f)["intents"]}
+    with open(catalog_path, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+
+    courses = [c["code"].replace(" ", "").upper() for c in catalog["courses"]]
+    with_prereqs = sorted({p["course"].replace(" ", "").upper() for p in catalog["prerequisites"]})
+    # "Dr. Ahmad Barghash" -> "Barghash", how students actually ask
+    surnames = [i["name"].split()[-1] for i in catalog["instructors"]]
+    return patterns, courses, with_prereqs or courses, surnames
+
+# ===================================================================
+# 2. FLOWS
+# ===================================================================
+# Each flow is a generator: it yields (step_name, message) and is sent the
+# server's reply. Follow-up steps are only sent (and labelled with a
+# ContextManager state) when the reply shows the server is in that state.
+# step_name may also be a function of the reply, for single-turn steps whose
+# label depends on what the server actually did.
+
+# Prompt text handle_intent sends when it enters each waiting state
+PROMPTS = {
+    "waiting_for_eligibility": "Please list your completed courses",
+    "waiting_for_prereq_confirmation": "Would you like to check the prerequisites",
+    "waiting_for_track": "are you **Cybersecurity**",
+    "waiting_for_courses": ("Now list your completed courses", "Which courses have you passed?"),
+    "waiting_for_grad_info": "To check graduation status, I need",
+}
+
+def in_state(reply, state):
+    expected = PROMPTS[state]
+    return any(p in reply for p in (expected if isinstance(expected, tuple) else (expected,)))
+
+class FlowBuilder:
+    def __init__(self, corpus, rng):
+        self.patterns, self.courses, self.with_prereqs, self.surnames = corpus
+        self.rng = rng
+
+    def passed_list(self, low=3, high=12):
+        picks = self.rng.sample(self.courses, k=min(len(self.courses), self.rng.randint(low, high)))
+        return "I passed " + ", ".join(picks)
+
+    def smalltalk(self):
+        tag = self.rng.choice(["greeting", "thanks", "about_bot", "help", "small_talk", "humor"])
+        yield f"smalltalk:{tag}", self.rng.choice(self.patterns.get(tag, ["hello"]))
+
+    def course_info(self):
+        code = self.rng.choice(self.courses)
+        yield "ask_course_info", self.rng.choice([f"What is {code}?", f"Tell me about {code}", f"credits for {code}?", f"{code} info"])
+
+    def prereqs(self):
+        yield "ask_prereqs", f"prereqs for {self.rng.choice(self.with_prereqs)}"
+
+    def instructor(self):
+        # No possessive: instructor lookup searches the last word, and "'s" would make it "s"
+        yield "ask_instructor_info", f"Where is Dr. {self.rng.choice(self.surnames)} office"
+
+    def eligibility(self):
+        target = self.rng.choice(self.with_prereqs)
+        reply = yield "check_eligibility", f"Can I take {target}?"
+        if not in_state(reply, "waiting_for_eligibility"): return
+        reply = yield "waiting_for_eligibility", self.passed_list()
+        if in_state(reply, "waiting_for_prereq_confirmation"):
+            yield "waiting_for_prereq_confirmation", self.rng.choice(["yes", "no"])
+
+    def plan(self):
+        reply = yield "make_schedule", self.rng.choice(["Plan my next semester", "Suggest a schedule", "Help me choose my courses"])
+        if in_state(reply, "waiting_for_track"):
+            reply = yield "waiting_for_track", self.rng.choice(TRACKS)
+        if in_state(reply, "waiting_for_courses"):
+            yield "waiting_for_courses:generate_plan", self.passed_list(5, 20)
+
+    def graduation(self):
+        track = self.rng.choice(TRACKS)
+        def label(reply):
+            if not reply: return "graduation_check"
+            if in_state(reply, "waiting_for_grad_info"): return "graduation_check:waiting_for_grad_info"
+            return "graduation_check:check_graduation"
+        yield label, f"check my graduation status, {track} track. {self.passed_list(10, 30)}"
+
+    def random_flow(self):
+        flows = [
+            (self.smalltalk, 2), (self.course_info, 3), (self.prereqs, 3), (self.instructor, 2),
+            (self.eligibility, 2), (self.plan, 2), (self.graduation, 1),
+        ]
+        fns, weights = zip(*flows)
+        flow = self.rng.choices(fns, weights=weights)[0]
+        return flow.__name__, flow()
+
+# ===================================================================
+# 3. STUDENTS
+# ===================================================================
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+
+    def record(self, step, latency_ms, status):
+        with self.lock:
+            self.latencies[step].append(latency_ms)
+            if status == 503:
+                self.shed[step] += 1
+            elif status != 200:
+                self.errors[step] += 1
+
+
+class Student(threading.Thread):
+    def __init__(self, url, corpus, stats, stop_event, seed, think_time, timeout):
+        super().__init__(daemon=True)
+        self.url = url.rstrip("/") + "/chat"
+        self.stats = stats
+        self.stop_event = stop_event
+        self.think_time = think_time
+        self.timeout = timeout
+        self.flows = FlowBuilder(corpus, random.Random(seed))
+        self.opener = None
+
+    def new_session(self):
+        # Fresh cookie jar = fresh server-side session, so passed courses from
+        # an earlier flow don't short-circuit the next one
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def send(self, message):
+        """Returns (status, reply text)"""
+        body = json.dumps({"message": message}).encode()
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, json.loads(resp.read()).get("response", "")
+        except urllib.error.HTTPError as e:
+            return e.code, ""
+        except Exception:
+            return 0, ""
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.new_session()
+            flow_name, flow = self.flows.random_flow()
+            reply = None
+            while not self.stop_event.is_set():
+                try:
+                    step, message = flow.send(reply)
+                except StopIteration:
+                    break
+                began = time.perf_counter()
+                status, reply = self.send(message)
+                latency = (time.perf_counter() - began) * 1000
+                if callable(step): step = step(reply)
+                self.stats.record(f"{flow_name}/{step}", latency, status)
+                if self.think_time:
+                    time.sleep(self.flows.rng.uniform(0, self.think_time))
+
+# ===================================================================
+# 4. RAMP & REPORT
+# ===================================================================
+
+def percentile(values, p):
+    # Stdlib only, so the generator can run from any machine without the bot's deps
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(stage, users, stats, elapsed):
+    total = sum(len(v) for v in stats.latencies.values())
+    errors = sum(stats.errors.values())
+    shed = sum(stats.shed.values())
+    print(f"\n📊 Stage {stage}: {users} students | {total} msgs in {elapsed:.1f}s | {total / elapsed:.1f} msg/s | errors {errors} | shed {shed}")
+    print(f"{'step':<48}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>7}{'503%':>7}")
+    for step in sorted(stats.latencies):
+        lat = stats.latencies[step]
+        n = len(lat)
+        print(f"{step:<48}{n:>6}{percentile(lat, 50):>9.1f}{percentile(lat, 95):>9.1f}{percentile(lat, 99):>9.1f}"
+              f"{100 * stats.errors[step] / n:>7.1f}{100 * stats.shed[step] / n:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-turn load test for the GJU chatbot")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--ramp", default="1,5,10,20", help="Comma-separated concurrent students per stage")
+    parser.add_argument("--stage-seconds", type=float, default=30)
+    parser.add_argument("--think-time", type=float, default=1.0, help="Max random pause between turns (s)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    stages = [int(x) for x in args.ramp.split(",") if x.strip()]
+
+    for i, users in enumerate(stages, start=1):
+        stats = Stats()
+        stop_event = threading.Event()
+        students = [
+            Student(args.url, corpus, stats, stop_event, seed=args.seed * 1000 + i * 100 + n,
+                    think_time=args.think_time, timeout=args.timeout)
+            for n in range(users)
+        ]
+        print(f"🚀 Stage {i}/{len(stages)}: {users} students for {args.stage_seconds:.0f}s...")
+        started = time.perf_counter()
+        for s in students: s.start()
+        time.sleep(args.stage_seconds)
+        stop_event.set()
+        for s in students: s.join(timeout=args.timeout)
+        report(i, users, stats, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,9 @@ import logging
 import os
 import json
 import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from mysql.connector import pooling
 import numpy as np
 import torch # <--- CHANGED: PyTorch
@@ -116,16 +119,19 @@ class CourseRepository:
         finally:
             if conn.is_connected(): conn.close()
 
+    # Stop words to ignore when searching instructors
+    INSTRUCTOR_STOP_WORDS = {"who", "is", "dr", "dr.", "prof", "prof.", "professor", "doctor", "where", "office", "email", "contact", "info", "the", "of", "tell", "me", "about"}
+
+    def instructor_search_terms(self, user_text):
+        words = re.findall(r'\b\w+\b', user_text.lower())
+        return [w for w in words if w not in self.INSTRUCTOR_STOP_WORDS]
+
     def fuzzy_find_instructor(self, user_text):
+        search_terms = self.instructor_search_terms(user_text)
+        if not search_terms: return None
+
         conn = self.get_connection()
         if not conn: return None
-        
-        # Stop words to ignore
-        stop_words = {"who", "is", "dr", "dr.", "prof", "prof.", "professor", "doctor", "where", "office", "email", "contact", "info", "the", "of", "tell", "me", "about"}
-        words = re.findall(r'\b\w+\b', user_text.lower())
-        search_terms = [w for w in words if w not in stop_words]
-        
-        if not search_terms: return None
         search_query = search_terms[-1] # Try the last significant word (e.g. "Hababeh")
 
         try:
@@ -191,13 +197,43 @@ class CourseRepository:
 # --- 3. Context Manager ---
 class ContextManager:
     TIMEOUT_SECONDS = 300  # <--- CHANGED: 5 Minutes (was 30s)
-
-    def __init__(self):
-        self.sessions = {}
+    EVICT_AFTER_SECONDS = TIMEOUT_SECONDS * 12  # Forget sessions idle for an hour
+    MAX_SESSIONS = 50000  # Hard cap: any cookie-less client creates a session
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        # Ordered by last interaction (oldest first), so eviction only looks at the front
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+
+    def _evict(self, current_time, incoming=None):
+        # Leave room for `incoming` if it is about to be added, so the cap holds after the insert
+        limit = self.max_sessions - (incoming is not None and incoming not in self.sessions)
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) > limit or current_time - oldest['last_interaction'] > self.EVICT_AFTER_SECONDS:
+                del self.sessions[oldest_id]
+            else:
+                break
 
     def get_context(self, user_id):
         current_time = time.time()
 
+        with self.lock:
+            self._evict(current_time, incoming=user_id)
+            ctx = self._get_or_create(user_id, current_time)
+            self.sessions.move_to_end(user_id)
+
+        if current_time - ctx.get('last_interaction', 0) > self.TIMEOUT_SECONDS:
+            # Reset only short-term status, try to keep data
+            ctx['status'] = 'idle'
+            ctx['target_course'] = None
+            ctx['pending_intent'] = None
+
+        ctx['last_interaction'] = current_time
+        return ctx
+
+    def _get_or_create(self, user_id, current_time):
         if user_id not in self.sessions:
             self.sessions[user_id] = {
                 'status': 'idle',
@@ -208,17 +244,7 @@ class ContextManager:
                 'last_interaction': current_time,
                 'pending_intent': None
             }
-
-        ctx = self.sessions[user_id]
-
-        if current_time - ctx.get('last_interaction', 0) > self.TIMEOUT_SECONDS:
-            # Reset only short-term status, try to keep data
-            ctx['status'] = 'idle'
-            ctx['target_course'] = None
-            ctx['pending_intent'] = None
-
-        ctx['last_interaction'] = current_time
-        return ctx
+        return self.sessions[user_id]
 
     def update_passed_courses(self, user_id, text_input):
         ctx = self.get_context(user_id)
@@ -351,4 +377,159 @@ class AcademicAdvisor:
             if len(remaining_compulsory) > 8: resp += f"...and {len(remaining_compulsory)-8} more.\n"
         
         resp += f"\nℹ️ Track Electives Passed: **{len(passed_electives)}**\n(You typically need 4-5 electives depending on your plan)."
-        return resp
\ No newline at end of file
+        return resp
+
+
+# --- 5. Response Cache ---
+class ResponseCache:
+    """
+    LRU cache of rendered catalog answers keyed by (intent, entity).
+    load_data.py bumps the catalog version file after every reload; when
+    the version changes the whole cache is dropped.
+    """
+    def __init__(self, max_size=512, version_file="catalog_version.json"):
+        self.max_size = max_size
+        self.version_file = version_file
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self._version_stamp = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _current_version(self):
+        # stat() is cheap; only re-read the file when it actually changed. The inode
+        # catches bumps within one mtime tick (load_data.py replaces the file each time).
+        try:
+            st = os.stat(self.version_file)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_ino)
+        if stamp != self._version_stamp:
+            self._version_stamp = stamp
+            try:
+                with open(self.version_file, "r", encoding="utf-8") as f:
+                    return json.load(f).get("version")
+            except (OSError, ValueError):
+                return stamp
+        return self.version
+
+    def _check_version(self):
+        version = self._current_version()
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+                logger.info(f"♻️ Catalog version {self.version} -> {version}, clearing response cache")
+            self.entries.clear()
+            self.version = version
+
+    def get(self, intent, entity):
+        with self.lock:
+            self._check_version()
+            key = (intent, entity)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, intent, entity, response):
+        with self.lock:
+            self._check_version()
+            self.entries[(intent, entity)] = response
+            self.entries.move_to_end((intent, entity))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# --- 6. Admission Control ---
+class AdmissionController:
+    """
+    Tracks in-flight /chat requests and the queue in front of the BERT
+    slots, and picks a service level for each new request:
+      full       -> rules + BERT + DB
+      rules_only -> skip BERT (Layer-1 rules + keyword fallback), also
+                    whenever bert_queue_at requests are already waiting for BERT
+      cache_only -> no BERT, no DB; cached catalog answers only
+      shed       -> fast 503 with a retry hint
+    """
+    FULL, RULES_ONLY, CACHE_ONLY, SHED = "full", "rules_only", "cache_only", "shed"
+
+    def __init__(self, rules_only_at=8, cache_only_at=16, shed_at=32, bert_queue_at=4, bert_concurrency=2, bert_wait=0.5):
+        self.rules_only_at = rules_only_at
+        self.bert_queue_at = bert_queue_at
+        self.cache_only_at = cache_only_at
+        self.shed_at = shed_at
+        self.bert_wait = bert_wait
+        self.bert_slots = threading.BoundedSemaphore(bert_concurrency)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.bert_waiting = 0
+        self.counts = {self.FULL: 0, self.RULES_ONLY: 0, self.CACHE_ONLY: 0, self.SHED: 0, "bert_timeouts": 0, "cache_only_misses": 0}
+
+    def admit(self):
+        with self.lock:
+            load = self.in_flight
+            if load >= self.shed_at:
+                level = self.SHED
+            elif load >= self.cache_only_at:
+                level = self.CACHE_ONLY
+            elif load >= self.rules_only_at or self.bert_waiting >= self.bert_queue_at:
+                level = self.RULES_ONLY
+            else:
+                level = self.FULL
+            self.counts[level] += 1
+            if level != self.SHED:
+                self.in_flight += 1
+            return level
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @contextmanager
+    def bert_slot(self):
+        """Yields True if a BERT slot was acquired within bert_wait seconds"""
+        with self.lock:
+            self.bert_waiting += 1
+        acquired = self.bert_slots.acquire(timeout=self.bert_wait)
+        with self.lock:
+            self.bert_waiting -= 1
+            if not acquired:
+                self.counts["bert_timeouts"] += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.bert_slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "bert_queue": self.bert_waiting,
+                "watermarks": {"rules_only": self.rules_only_at, "cache_only": self.cache_only_at, "shed": self.shed_at, "bert_queue": self.bert_queue_at},
+                "counts": dict(self.counts),
+            }
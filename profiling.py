@@ -0,0 +1,164 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import random
+import cProfile
+import logging
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+logger = logging.getLogger("Profiling")
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples one thread's Python stack every `interval` seconds and keeps
+    the counts in folded format ("root;child;leaf N"), which flamegraph.pl,
+    speedscope and inferno read directly.
+    """
+    def __init__(self, target_thread_id, interval=0.001):
+        super().__init__(daemon=True)
+        self.target = target_thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """
+    Per-request stage timings for every /chat turn, plus opt-in deep
+    profiles (cProfile + stack samples + torch operator trace) for requests
+    that carry the admin token or win the sampling draw.
+    """
+    def __init__(self, out_dir="profiles", token=None, sample_rate=0.0, slow_ms=500, keep=50, sample_interval=0.001):
+        self.out_dir = out_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.sample_interval = sample_interval
+        self.slow = deque(maxlen=keep)
+        self.local = threading.local()
+        # cProfile and the torch profiler are process-wide: one deep profile at a time
+        self.profile_lock = threading.Lock()
+
+    def is_admin(self, token):
+        # Constant-time compare so the token can't be guessed byte by byte
+        return bool(self.token) and bool(token) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def should_profile(self, token=None):
+        return self.is_admin(token) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the block's duration to the current request's breakdown (no-op outside a request)"""
+        stages = getattr(self.local, "stages", None)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if stages is not None:
+                stages[name] = stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    @contextmanager
+    def request(self, message, profile=False):
+        """Wraps one /chat turn. Yields a dict the caller can annotate (tag, tier...)."""
+        record = {"message": message[:80], "stages": {}}
+        self.local.stages = record["stages"]
+
+        deep = profile and self.profile_lock.acquire(blocking=False)
+        if profile and not deep:
+            logger.info("Profiler busy, skipping deep profile for this request")
+        if deep:
+            try:
+                profiler, sampler, torch_prof = self._start_deep()
+            except Exception as err:
+                # e.g. another profiler already active: skip, but never keep the lock
+                logger.error(f"Could not start deep profile: {err}")
+                self.profile_lock.release()
+                deep = False
+
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            total = (time.perf_counter() - started) * 1000
+            if deep:
+                try:
+                    record["profile"] = self._stop_deep(profiler, sampler, torch_prof)
+                finally:
+                    self.profile_lock.release()
+
+            self.local.stages = None
+            record["stages"]["total"] = total
+            record["stages"] = {k: round(v, 2) for k, v in record["stages"].items()}
+            record["ts"] = time.time()
+            if total >= self.slow_ms or deep:
+                self.slow.append(record)
+
+    def _start_deep(self):
+        """Starts all three profilers; on failure stops whatever already started, then re-raises"""
+        torch_prof = sampler = None
+        try:
+            if torch is not None:
+                torch_prof = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                torch_prof.__enter__()
+            sampler = StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler, sampler, torch_prof
+        except Exception:
+            if sampler is not None:
+                sampler.stop()
+            if torch_prof is not None:
+                torch_prof.__exit__(None, None, None)
+            raise
+
+    def _stop_deep(self, profiler, sampler, torch_prof):
+        profiler.disable()
+        sampler.stop()
+        if torch_prof is not None:
+            torch_prof.__exit__(None, None, None)
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}")
+        files = {"cprofile": base + ".prof", "stacks": base + ".folded"}
+        profiler.dump_stats(files["cprofile"])  # snakeviz or flameprof
+        sampler.write(files["stacks"])
+        # Only worth a file if BERT actually ran in this request
+        if torch_prof is not None and torch_prof.key_averages():
+            files["torch"] = base + ".torch.json"  # chrome://tracing or Perfetto
+            torch_prof.export_chrome_trace(files["torch"])
+        return files
+
+    def recent_slow(self):
+        return sorted(self.slow, key=lambda r: r["stages"]["total"], reverse=True)
@@ -0,0 +1,139 @@
+import os
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from conversation_log import read_logs
+
+# Replayed turns must not be written back into the production log
+os.environ["CONVERSATION_LOG"] = "0"
+
+# ===================================================================
+# REPLAY: feed logged conversations back through the bot
+# ===================================================================
+# Turns go through app.answer_message, the same path /chat uses (admission
+# control, cache-only and shed included).
+#
+# --mode regression (default): admission is opened up (no degradation, one BERT
+#     slot per worker, no slot timeout) so tag changes come from the model only.
+# --mode load: the server's own admission settings, to see how /chat copes.
+#
+# Examples:
+#   python replay.py                                   # real-time regression check
+#   python replay.py --speed 10                        # 10x faster than production
+#   python replay.py --mode load --speed 0 --workers 32  # as fast as possible
+#
+# Timed replays (--speed > 0) run one thread per session so every turn fires
+# at its own (scaled) time; --workers only caps the --speed 0 mode.
+
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def replay_session(app_module, session, entries, t0, start, speed, results, lock):
+    user_id = f"replay-{session}"
+    for entry in entries:
+        if speed > 0:
+            delay = (entry["ts"] - t0) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        began = time.perf_counter()
+        try:
+            _, _, tag, tier = app_module.answer_message(user_id, entry["message"])
+            error = None
+        except Exception as e:
+            tag, tier, error = None, None, repr(e)
+        latency = (time.perf_counter() - began) * 1000
+
+        with lock:
+            results.append({
+                "message": entry["message"],
+                "logged_tag": entry.get("tag"),
+                "logged_tier": entry.get("tier"),
+                "tag": tag,
+                "tier": tier,
+                "latency_ms": latency,
+                "error": error,
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay conversation logs through the /chat path (answer_message)")
+    parser.add_argument("--log", default=os.path.join("logs", "conversations.jsonl"), help="Log file (rotated siblings are included)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed multiplier vs. the original timing (0 = no waiting)")
+    parser.add_argument("--workers", type=int, default=16, help="Max sessions replayed in parallel with --speed 0 (timed replays run every session at once)")
+    parser.add_argument("--limit", type=int, default=0, help="Only replay the first N turns")
+    parser.add_argument("--mode", choices=["regression", "load"], default="regression", help="See header comment")
+    args = parser.parse_args()
+
+    entries = [e for e in read_logs(args.log) if e.get("message")]
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print(f"⚠️ No log entries found at {args.log}")
+        return
+
+    sessions = defaultdict(list)
+    for e in entries:
+        sessions[e.get("session", "anon")].append(e)
+    for turns in sessions.values():
+        turns.sort(key=lambda e: e["ts"])  # Rotated files may interleave
+    print(f"📂 {len(entries)} turns across {len(sessions)} sessions.")
+
+    # Timed replays need every session on the clock at once: a capped pool would start
+    # late sessions behind schedule and fire their whole backlog in one burst
+    workers = len(sessions) if args.speed > 0 else args.workers
+
+    print("⏳ Loading the bot...")
+    import app as app_module
+    from logic import AdmissionController
+
+    if args.mode == "regression":
+        never = len(entries) + workers + 1
+        app_module.admission = AdmissionController(
+            rules_only_at=never, cache_only_at=never, shed_at=never, bert_queue_at=never,
+            bert_concurrency=workers, bert_wait=None,
+        )
+    print(f"🚦 Mode: {args.mode} | admission {app_module.admission.stats()['watermarks']}")
+
+    t0 = min(e["ts"] for e in entries)
+    results, lock = [], threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for session, turns in sessions.items():
+            pool.submit(replay_session, app_module, session, turns, t0, start, args.speed, results, lock)
+    elapsed = time.perf_counter() - start
+
+    # --- Report ---
+    latencies = [r["latency_ms"] for r in results]
+    errors = [r for r in results if r["error"]]
+    # Only compare turns classified normally both in production and in this replay
+    degraded = ("shed", "cache", "cache_miss")
+    comparable = [r for r in results if r["logged_tag"] and r["logged_tier"] not in degraded and r["tier"] not in degraded]
+    changed = [r for r in comparable if r["tag"] != r["logged_tag"]]
+
+    print("\n📊 Replay Report")
+    print(f"Turns: {len(results)} in {elapsed:.1f}s ({len(results) / elapsed:.1f} msg/s)")
+    print(f"Latency ms  p50: {percentile(latencies, 50):.1f}  p95: {percentile(latencies, 95):.1f}  p99: {percentile(latencies, 99):.1f}")
+    print(f"Errors: {len(errors)}")
+    counts = app_module.admission.stats()["counts"]
+    print(f"Tag changes vs. log: {len(changed)}/{len(comparable)} | BERT slot timeouts: {counts['bert_timeouts']}")
+    if counts["bert_timeouts"]:
+        print("  ⚠️ Some turns skipped BERT waiting for a slot; their tags may differ for that reason.")
+    print("Admission: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    print("Tiers: " + ", ".join(f"{t}={n}" for t, n in Counter(r["tier"] for r in results).most_common()))
+
+    for r in changed[:10]:
+        print(f"  ↪ '{r['message']}': {r['logged_tag']} -> {r['tag']}")
+    for r in errors[:5]:
+        print(f"  ❌ '{r['message']}': {r['error']}")
+
+
+if __name__ == "__main__":
+    main()
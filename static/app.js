@@ -127,13 +127,48 @@ document.addEventListener("DOMContentLoaded", () => {
         chatBox.scrollTo({ top: chatBox.scrollHeight, behavior: 'smooth' });
     }
 
-    async function sendMessage() {
-        const text = userInput.value.trim();
-        if (!text) return;
+    // --- 5. WEBSOCKET CHANNEL (HTTP fetch is the fallback) ---
+    // Messages go out as plain-text frames and replies come back in order,
+    // so `pending` is a FIFO of messages still waiting for an answer.
+    let socket = null;
+    let reconnectDelay = 1000;
+    let socketEverOpened = false;
+    const pending = [];
+    // HTTP sends are chained so they can't overtake each other or a later WS send
+    let httpChain = Promise.resolve();
+    let httpInFlight = 0;
+
+    function connectSocket() {
+        if (!('WebSocket' in window)) return;
+
+        // The session is bound from the (HttpOnly) cookie, so reconnecting resumes it
+        const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+        socket = new WebSocket(`${scheme}://${location.host}/ws`);
+
+        socket.onopen = () => { reconnectDelay = 1000; socketEverOpened = true; };
+
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            pending.shift();
+            addMessage(data.response, 'bot');
+        };
 
-        addMessage(text, 'user');
-        userInput.value = '';
+        socket.onclose = () => {
+            socket = null;
+            // The server may already have handled these (only the reply was lost), and
+            // they change the conversation state, so report them instead of resending
+            const lost = pending.splice(0).length;
+            if (lost) {
+                addMessage(`⚠️ Connection lost before I could answer ${lost === 1 ? 'your last message' : `your last ${lost} messages`}. Please check and send again if needed.`, 'bot');
+            }
+            // Never connected (e.g. the server runs without flask-sock): stay on HTTP
+            if (!socketEverOpened) return;
+            setTimeout(connectSocket, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        };
+    }
 
+    async function sendOverHttp(text) {
         try {
             const response = await fetch('/chat', {
                 method: 'POST',
@@ -151,6 +186,24 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    function sendMessage() {
+        const text = userInput.value.trim();
+        if (!text) return;
+
+        addMessage(text, 'user');
+        userInput.value = '';
+
+        if (socket && socket.readyState === WebSocket.OPEN && httpInFlight === 0) {
+            pending.push(text);
+            socket.send(text);
+        } else {
+            httpInFlight++;
+            httpChain = httpChain.then(() => sendOverHttp(text)).finally(() => { httpInFlight--; });
+        }
+    }
+
+    connectSocket();
+
     sendBtn.addEventListener('click', sendMessage);
     userInput.addEventListener('keypress', (e) => {
         if (e.key === 'Enter') sendMessage();
@@ -2,9 +2,15 @@ import os
 import json
 import re
 import pickle
+import random
+import hashlib
+import copy
+import time
+import argparse
+import shutil
 import torch
 import numpy as np
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, Sampler
 from transformers import BertTokenizer, BertForSequenceClassification, AdamW
 from sklearn.preprocessing import LabelEncoder
 from tqdm import tqdm
@@ -19,6 +25,28 @@ EPOCHS = 10
 MAX_LEN = 50
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Hold out a slice of every intent to pick the epoch count, then retrain on everything
+VAL_FRACTION = 0.1
+PATIENCE = 3  # Epochs without held-out loss improvement before we stop
+SEED = 42
+
+# CPU threads: default to every core, override with TORCH_NUM_THREADS
+NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", os.cpu_count() or 1))
+
+CACHE_DIR = ".cache"
+WEIGHTS_FILES = ["model.safetensors", "pytorch_model.bin"]  # Whichever save_pretrained wrote
+
+# Distillation: the fine-tuned BERT teaches a compact pretrained student
+TEACHER_DIR = "bert_intent_model"
+STUDENT_NAME = "google/bert_uncased_L-4_H-256_A-4"  # 4 layers, 256 hidden, same vocab
+STUDENT_DIR = "bert_student_model"
+TEACHER_EXTRAS = ["label_encoder.pickle", "max_len.json"]  # Copied as-is into the student directory
+DISTILL_EPOCHS = 30
+DISTILL_LR = 1e-4
+TEMPERATURE = 2.0
+ALPHA = 0.7  # Weight of the soft (teacher) loss vs. the hard label loss
+AUGMENT_PER_PATTERN = 4
+
 # ===================================================================
 # 2. UTILS
 # ===================================================================
@@ -29,129 +57,729 @@ def clean_text(text):
     text = re.sub(r"[^a-z0-9\s]", "", text)
     return text.strip()
 
-# ===================================================================
-# 3. LOAD DATA
-# ===================================================================
-
-print("⏳ Loading and processing data...")
+def set_seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
 
-with open("intents.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+def configure_threads():
+    """Pin intra-op threads so CPU training doesn't oversubscribe cores"""
+    if DEVICE.type == "cpu":
+        torch.set_num_threads(NUM_THREADS)
+        print(f"🧵 Using {NUM_THREADS} CPU threads.")
 
-texts = []
-labels = []
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-for intent in data["intents"]:
-    for pattern in intent["patterns"]:
-        texts.append(clean_text(pattern))
-        labels.append(intent["tag"])
+def model_fingerprint(model_dir, classes):
+    """Ties files saved next to a model (early-exit heads) to its exact weights and label set"""
+    weights = next(os.path.join(model_dir, n) for n in WEIGHTS_FILES if os.path.exists(os.path.join(model_dir, n)))
+    return hashlib.sha256(f"{file_hash(weights)}|{','.join(str(c) for c in classes)}".encode()).hexdigest()
 
-# Encode labels
-encoder = LabelEncoder()
-y = encoder.fit_transform(labels)
-num_classes = len(encoder.classes_)
+# ===================================================================
+# 3. LOAD DATA
+# ===================================================================
 
-print(f"✅ Found {len(texts)} patterns and {num_classes} unique tags.")
+def load_patterns(path="intents.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    texts = []
+    labels = []
+    for intent in data["intents"]:
+        for pattern in intent["patterns"]:
+            texts.append(clean_text(pattern))
+            labels.append(intent["tag"])
+    return texts, labels
+
+def split_holdout(labels, fraction=VAL_FRACTION, seed=SEED):
+    """Per-intent split so every tag keeps examples on the training side"""
+    rng = random.Random(seed)
+    by_label = {}
+    for i, label in enumerate(labels):
+        by_label.setdefault(label, []).append(i)
+
+    train_idx, val_idx = [], []
+    for idxs in by_label.values():
+        idxs = idxs[:]
+        rng.shuffle(idxs)
+        n_val = int(len(idxs) * fraction)
+        if len(idxs) >= 3:
+            n_val = max(1, n_val)
+        val_idx.extend(idxs[:n_val])
+        train_idx.extend(idxs[n_val:])
+    return train_idx, val_idx
 
 # ===================================================================
-# 4. TOKENIZATION
+# 4. TOKENIZATION (once, cached on disk)
 # ===================================================================
 
-print("⏳ Tokenizing data...")
-tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
+def tokenize_corpus(texts, tokenizer):
+    """
+    Tokenize the texts once (no padding) and cache the ids keyed by a hash
+    of the exact texts, tokenizer and MAX_LEN, so retraining on unchanged
+    data skips this step and any change to the texts misses the cache.
+    """
+    payload = json.dumps([tokenizer.name_or_path, MAX_LEN, list(texts)], ensure_ascii=False)
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"tokens_{key}.pt")
+
+    if os.path.exists(cache_path):
+        print(f"⚡ Using cached tokens: {cache_path}")
+        return torch.load(cache_path)
+
+    print("⏳ Tokenizing data...")
+    encoded = tokenizer(texts, truncation=True, max_length=MAX_LEN)
+    input_ids = [torch.tensor(ids, dtype=torch.long) for ids in encoded["input_ids"]]
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    torch.save(input_ids, cache_path)
+    return input_ids
 
 # Dataset class
 class IntentDataset(Dataset):
-    def __init__(self, texts, labels, tokenizer, max_len):
-        self.texts = texts
+    def __init__(self, input_ids, labels):
+        self.input_ids = input_ids
         self.labels = labels
-        self.tokenizer = tokenizer
-        self.max_len = max_len
 
     def __len__(self):
-        return len(self.texts)
+        return len(self.input_ids)
 
     def __getitem__(self, idx):
-        text = self.texts[idx]
-        label = self.labels[idx]
-        encoding = self.tokenizer(
-            text,
-            padding="max_length",
-            truncation=True,
-            max_length=self.max_len,
-            return_tensors="pt"
-        )
-        item = {key: val.squeeze(0) for key, val in encoding.items()}
-        item["labels"] = torch.tensor(label)
-        return item
-
-dataset = IntentDataset(texts, y, tokenizer, MAX_LEN)
-dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
+        return self.input_ids[idx], int(self.labels[idx])
+
+def pad_collate(batch, pad_id=0):
+    """Dynamic padding: pad only up to the longest sequence in the batch"""
+    ids, labels = zip(*batch)
+    max_len = max(len(x) for x in ids)
+    input_ids = torch.full((len(ids), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(ids), max_len), dtype=torch.long)
+    for i, x in enumerate(ids):
+        input_ids[i, :len(x)] = x
+        attention_mask[i, :len(x)] = 1
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "labels": torch.tensor(labels, dtype=torch.long),
+    }
+
+class BucketBatchSampler(Sampler):
+    """
+    Groups examples of similar length into the same batch. Lengths are
+    sorted inside shuffled pools so batches still vary between epochs.
+    """
+    def __init__(self, lengths, batch_size, shuffle=True, pool_factor=50):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_size = batch_size * pool_factor
+
+    def __iter__(self):
+        idxs = list(range(len(self.lengths)))
+        if self.shuffle:
+            random.shuffle(idxs)
+
+        batches = []
+        for start in range(0, len(idxs), self.pool_size):
+            pool = sorted(idxs[start:start + self.pool_size], key=lambda i: self.lengths[i])
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+
+        if self.shuffle:
+            random.shuffle(batches)
+        return iter(batches)
 
-# ===================================================================
-# 5. MODEL
-# ===================================================================
-
-print(f"⏳ Downloading {MODEL_NAME} model...")
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
 
-model = BertForSequenceClassification.from_pretrained(
-    MODEL_NAME,
-    num_labels=num_classes
-)
-model.to(DEVICE)
+def make_loader(input_ids, labels, shuffle, pad_id=0):
+    dataset = IntentDataset(input_ids, labels)
+    sampler = BucketBatchSampler([len(x) for x in input_ids], BATCH_SIZE, shuffle=shuffle)
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=lambda b: pad_collate(b, pad_id))
 
 # ===================================================================
-# 6. TRAINING
+# 5. TRAINING
 # ===================================================================
 
-optimizer = AdamW(model.parameters(), lr=2e-5)
-loss_fn = torch.nn.CrossEntropyLoss()
-
-print("🚀 Starting training...")
-
-for epoch in range(EPOCHS):
-    model.train()
-    epoch_loss = 0
+def evaluate(model, dataloader):
+    model.eval()
     correct = 0
     total = 0
+    with torch.no_grad():
+        for batch in dataloader:
+            input_ids = batch["input_ids"].to(DEVICE)
+            attention_mask = batch["attention_mask"].to(DEVICE)
+            labels_batch = batch["labels"].to(DEVICE)
+            logits = model(input_ids, attention_mask=attention_mask).logits
+            correct += (logits.argmax(dim=1) == labels_batch).sum().item()
+            total += labels_batch.size(0)
+    return correct / total if total else 0.0
+
+def heldout_loss(model, dataloader):
+    """Mean cross-entropy: keeps moving after accuracy on a few dozen patterns saturates"""
+    model.eval()
+    loss_fn = torch.nn.CrossEntropyLoss(reduction="sum")
+    total_loss = 0.0
+    total = 0
+    with torch.no_grad():
+        for batch in dataloader:
+            logits = model(batch["input_ids"].to(DEVICE), attention_mask=batch["attention_mask"].to(DEVICE)).logits
+            total_loss += loss_fn(logits, batch["labels"].to(DEVICE)).item()
+            total += batch["labels"].size(0)
+    return total_loss / total if total else 0.0
+
+def train(model, train_loader, val_loader, epochs=EPOCHS, lr=2e-5, loss_step=None):
+    """
+    Standard fine-tuning loop. With a val_loader it stops early on held-out
+    loss and restores the best epoch; without one it runs all `epochs`.
+    `loss_step(model, batch)` can replace the plain cross-entropy loss
+    (used by the distillation mode). Returns (best_epoch, best_val_loss).
+    """
+    optimizer = AdamW(model.parameters(), lr=lr)
+    loss_fn = torch.nn.CrossEntropyLoss()
+
+    best_loss = float("inf")
+    best_epoch = epochs
+    best_state = None
+    bad_epochs = 0
+
+    for epoch in range(epochs):
+        model.train()
+        epoch_loss = 0
+        correct = 0
+        total = 0
+
+        for batch in tqdm(train_loader, desc=f"Epoch {epoch+1}/{epochs}"):
+            batch = {k: v.to(DEVICE) for k, v in batch.items()}
+
+            optimizer.zero_grad()
+            if loss_step:
+                loss, logits = loss_step(model, batch)
+            else:
+                logits = model(batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+                loss = loss_fn(logits, batch["labels"])
+            loss.backward()
+            optimizer.step()
+
+            epoch_loss += loss.item()
+            preds = torch.argmax(logits, dim=1)
+            correct += (preds == batch["labels"]).sum().item()
+            total += batch["labels"].size(0)
+
+        print(f"Epoch {epoch+1} | Loss: {epoch_loss/len(train_loader):.4f} | Accuracy: {correct/total:.4f}", end="")
+        if not val_loader:
+            print()
+            continue
+
+        val_loss = heldout_loss(model, val_loader)
+        print(f" | Val loss: {val_loss:.4f} | Val acc: {evaluate(model, val_loader):.4f}")
+
+        if val_loss < best_loss:
+            best_loss = val_loss
+            best_epoch = epoch + 1
+            best_state = copy.deepcopy(model.state_dict())
+            bad_epochs = 0
+        else:
+            bad_epochs += 1
+            if bad_epochs >= PATIENCE:
+                print(f"⏹️ Early stopping (no val loss improvement for {PATIENCE} epochs).")
+                break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return best_epoch, best_loss
 
-    for batch in tqdm(dataloader, desc=f"Epoch {epoch+1}/{EPOCHS}"):
-        input_ids = batch["input_ids"].to(DEVICE)
-        attention_mask = batch["attention_mask"].to(DEVICE)
-        labels_batch = batch["labels"].to(DEVICE)
-
-        optimizer.zero_grad()
-        outputs = model(input_ids, attention_mask=attention_mask)
-        logits = outputs.logits
-        loss = loss_fn(logits, labels_batch)
-        loss.backward()
-        optimizer.step()
-
-        epoch_loss += loss.item()
-        preds = torch.argmax(logits, dim=1)
-        correct += (preds == labels_batch).sum().item()
-        total += labels_batch.size(0)
+# ===================================================================
+# 6. DISTILLATION
+# ===================================================================
 
-    print(f"Epoch {epoch+1} | Loss: {epoch_loss/len(dataloader):.4f} | Accuracy: {correct/total:.4f}")
+FILLERS = ["please", "can you tell me", "i want to know", "quick question", "hey", "um"]
+
+def augment(text, rng, n=AUGMENT_PER_PATTERN):
+    """Cheap paraphrases: word dropout, neighbour swaps and filler phrases"""
+    words = text.split()
+    variants = set()
+    for _ in range(n * 3):
+        w = words[:]
+        op = rng.random()
+        if op < 0.33 and len(w) > 2:
+            del w[rng.randrange(len(w))]
+        elif op < 0.66 and len(w) > 1:
+            i = rng.randrange(len(w) - 1)
+            w[i], w[i + 1] = w[i + 1], w[i]
+        else:
+            filler = rng.choice(FILLERS)
+            w = filler.split() + w if rng.random() < 0.5 else w + filler.split()
+        candidate = " ".join(w)
+        if candidate and candidate != text:
+            variants.add(candidate)
+        if len(variants) >= n:
+            break
+    return sorted(variants)
+
+def augment_split(texts, y, indices):
+    """Patterns at `indices` plus their augment() paraphrases, with labels"""
+    rng = random.Random(SEED)
+    aug_texts, aug_labels = [], []
+    for i in indices:
+        for text in [texts[i]] + augment(texts[i], rng):
+            aug_texts.append(text)
+            aug_labels.append(y[i])
+    return aug_texts, np.array(aug_labels)
+
+def distill_step(teacher):
+    """Loss = ALPHA * KL(student || teacher, softened) + (1 - ALPHA) * CE(labels)"""
+    ce = torch.nn.CrossEntropyLoss()
+    kl = torch.nn.KLDivLoss(reduction="batchmean")
+
+    def step(model, batch):
+        with torch.no_grad():
+            t_logits = teacher(batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+        s_logits = model(batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+        soft = kl(
+            torch.nn.functional.log_softmax(s_logits / TEMPERATURE, dim=1),
+            torch.nn.functional.softmax(t_logits / TEMPERATURE, dim=1),
+        ) * (TEMPERATURE ** 2)
+        hard = ce(s_logits, batch["labels"])
+        return ALPHA * soft + (1 - ALPHA) * hard, s_logits
+    return step
+
+def weights_size_mb(model, path):
+    """
+    Size of the saved weights only; the model directory also holds the
+    index, exit heads and tokenizer files, which would skew the comparison
+    """
+    weights = os.path.join(path, "model.safetensors")
+    if os.path.exists(weights):
+        return os.path.getsize(weights) / (1024 * 1024)
+    return sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+
+def measure_latency(model, tokenizer, texts, runs=50):
+    """Mean single-message latency in ms, the way app.py calls the model"""
+    model.eval()
+    sample = texts[:runs]
+    with torch.no_grad():
+        model(**tokenizer(sample[0], return_tensors="pt").to(DEVICE))  # Warm-up
+        start = time.perf_counter()
+        for text in sample:
+            model(**tokenizer(text, return_tensors="pt").to(DEVICE))
+    return (time.perf_counter() - start) * 1000 / len(sample)
+
+def distill():
+    set_seed(SEED)
+    configure_threads()
+
+    print("⏳ Loading and processing data...")
+    texts, labels = load_patterns()
+
+    # Reuse the teacher's label mapping so the student is a drop-in replacement
+    with open("label_encoder.pkl", "rb") as f:
+        encoder = pickle.load(f)
+    y = encoder.transform(labels)
+
+    tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
+    train_idx, val_idx = split_holdout(labels)
+
+    # Augment only the training side so held-out accuracy stays honest
+    aug_texts, aug_labels = augment_split(texts, y, train_idx)
+    print(f"✅ {len(train_idx)} training patterns augmented to {len(aug_texts)} examples.")
+
+    input_ids = tokenize_corpus(texts, tokenizer)
+    pad_id = tokenizer.pad_token_id
+    train_loader = make_loader(tokenize_corpus(aug_texts, tokenizer), aug_labels, shuffle=True, pad_id=pad_id)
+    val_loader = make_loader([input_ids[i] for i in val_idx], y[val_idx], shuffle=False, pad_id=pad_id) if val_idx else None
+    all_loader = make_loader(input_ids, y, shuffle=False, pad_id=pad_id)
+
+    print(f"⏳ Loading teacher from {TEACHER_DIR}...")
+    teacher = BertForSequenceClassification.from_pretrained(TEACHER_DIR)
+    teacher.to(DEVICE)
+    teacher.eval()
+
+    print(f"⏳ Downloading student {STUDENT_NAME}...")
+    student = BertForSequenceClassification.from_pretrained(
+        STUDENT_NAME,
+        num_labels=len(encoder.classes_)
+    )
+    student.to(DEVICE)
+
+    # Pass 1: choose the epoch count on the held-out split
+    print("🚀 Pass 1: distilling with a held-out split...")
+    best_epoch, _ = train(student, train_loader, val_loader, epochs=DISTILL_EPOCHS, lr=DISTILL_LR, loss_step=distill_step(teacher))
+    # The only truly held-out number: the teacher and the final student both train on every pattern
+    student_heldout = evaluate(student, val_loader) if val_loader else None
+
+    # Pass 2: retrain from scratch on every pattern, like main() does for the teacher
+    if val_idx:
+        all_texts, all_labels = augment_split(texts, y, range(len(texts)))
+        print(f"🚀 Pass 2: distilling on all {len(texts)} patterns ({len(all_texts)} examples) for {best_epoch} epochs...")
+        set_seed(SEED)
+        student = BertForSequenceClassification.from_pretrained(STUDENT_NAME, num_labels=len(encoder.classes_))
+        student.to(DEVICE)
+        full_loader = make_loader(tokenize_corpus(all_texts, tokenizer), all_labels, shuffle=True, pad_id=pad_id)
+        train(student, full_loader, None, epochs=best_epoch, lr=DISTILL_LR, loss_step=distill_step(teacher))
+
+    print("⏳ Saving student...")
+    student.save_pretrained(STUDENT_DIR)
+    # Same layout as the teacher directory, so it can be used anywhere the teacher is
+    tokenizer.save_pretrained(STUDENT_DIR)
+    for name in TEACHER_EXTRAS:
+        if os.path.exists(os.path.join(TEACHER_DIR, name)):
+            shutil.copy(os.path.join(TEACHER_DIR, name), os.path.join(STUDENT_DIR, name))
+
+    # Side-by-side report
+    report = {}
+    for name, model, path in [("teacher", teacher, TEACHER_DIR), ("student", student, STUDENT_DIR)]:
+        report[name] = {
+            "params_m": sum(p.numel() for p in model.parameters()) / 1e6,
+            "size_mb": weights_size_mb(model, path),
+            "latency_ms": measure_latency(model, tokenizer, texts),
+            "acc_all": evaluate(model, all_loader),
+        }
+    report["student"]["acc_heldout_pass1"] = student_heldout
+    report["teacher"]["acc_heldout_pass1"] = None
+
+    with open(os.path.join(STUDENT_DIR, "distill_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    build_pattern_index(student, tokenizer, texts, labels, STUDENT_DIR, encoder.classes_)
+    train_early_exit(STUDENT_DIR)
+
+    print("\n📊 Teacher vs Student")
+    print(f"{'':<18}{'teacher':>12}{'student':>12}")
+    for key in ["params_m", "size_mb", "latency_ms", "acc_all", "acc_heldout_pass1"]:
+        cells = [report[name][key] for name in ("teacher", "student")]
+        if all(c is None for c in cells): continue
+        print(f"{key:<18}" + "".join(f"{'-':>12}" if c is None else f"{c:>12.3f}" for c in cells))
+
+    print(f"\n✅ Student saved to {STUDENT_DIR}/ (serve it with INTENT_MODEL_DIR={STUDENT_DIR})")
 
 # ===================================================================
-# 7. SAVE ARTIFACTS
+# 7. PATTERN INDEX (retrieval tier in app.py)
 # ===================================================================
 
-print("⏳ Saving artifacts...")
+INDEX_FILE = "pattern_embeddings.npy"
+INDEX_TAGS_FILE = "pattern_tags.json"
+INDEX_META_FILE = "pattern_index.json"
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_MIN_PRECISION = 0.95  # Accepted retrievals that must carry the right tag
+CALIBRATION_PARAPHRASES = 2     # augment() variants per pattern, on top of the pattern itself
+
+def embed_patterns(model, tokenizer, texts):
+    """Mean-pooled last hidden layer, L2-normalized, one row per text (in input order)"""
+    input_ids = tokenize_corpus(texts, tokenizer)
+    loader = make_loader(input_ids, np.zeros(len(texts)), shuffle=False, pad_id=tokenizer.pad_token_id)
+
+    model.eval()
+    rows = []
+    order = []
+    with torch.no_grad():
+        for batch_idx, batch in zip(loader.batch_sampler, loader):
+            mask = batch["attention_mask"].to(DEVICE).unsqueeze(-1).float()
+            outputs = model(batch["input_ids"].to(DEVICE), attention_mask=batch["attention_mask"].to(DEVICE), output_hidden_states=True)
+            pooled = (outputs.hidden_states[-1] * mask).sum(dim=1) / mask.sum(dim=1)
+            rows.append(pooled.cpu().numpy())
+            order.extend(batch_idx)
+
+    # Bucketed batches come back out of order; put rows back in input order
+    matrix = np.empty((len(texts), rows[0].shape[1]), dtype=np.float32)
+    matrix[order] = np.concatenate(rows)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+    return matrix
+
+def retrieval_vote(sims, tags, k=RETRIEVAL_TOP_K):
+    """Same top-k vote as app.retrieve_intent: (tag, best similarity, has clear majority)"""
+    k = min(k, len(sims))
+    top = np.argpartition(-sims, k - 1)[:k]
+    votes = {}
+    for i in top:
+        votes[tags[i]] = votes.get(tags[i], 0.0) + float(sims[i])
+    tag = max(votes, key=votes.get)
+    best = max(float(sims[i]) for i in top if tags[i] == tag)
+    return tag, best, votes[tag] > 0.5 * sum(votes.values())
+
+def calibrate_retrieval(model, tokenizer, texts, labels, matrix):
+    """
+    Pick the similarity cutoff for the retrieval tier. Every pattern (and a
+    few paraphrases of it) is queried against the index with its own row
+    left out, so each query is effectively held out. The cutoff is the
+    lowest score at which accepted answers still reach
+    RETRIEVAL_MIN_PRECISION; `unknown` patterns count as errors whenever
+    they are mapped onto a real intent.
+    """
+    rng = random.Random(SEED)
+    queries, sources = [], []
+    for i, text in enumerate(texts):
+        for q in [text] + augment(text, rng, CALIBRATION_PARAPHRASES):
+            queries.append(q)
+            sources.append(i)
+    query_matrix = embed_patterns(model, tokenizer, queries)
+
+    scored = []  # (best similarity, correct, is an unknown query)
+    for q, src in enumerate(sources):
+        sims = matrix @ query_matrix[q]
+        sims[src] = -np.inf  # Leave the source pattern out
+        tag, best, majority = retrieval_vote(sims, labels)
+        if majority:
+            scored.append((best, tag == labels[src], labels[src] == "unknown"))
+
+    # Walk the cutoff down from the top score; keep the lowest one that is still precise enough
+    scored.sort(key=lambda s: s[0], reverse=True)
+    threshold, correct = None, 0
+    for n, (best, ok, _) in enumerate(scored, start=1):
+        correct += ok
+        if correct / n >= RETRIEVAL_MIN_PRECISION:
+            threshold = best
+
+    if threshold is None:
+        print(f"⚠️ No cutoff reaches {RETRIEVAL_MIN_PRECISION:.0%} precision; retrieval tier disabled.")
+        return {"threshold": None, "coverage": 0.0, "unknown_false_accepts": 0.0}
+
+    accepted = [s for s in scored if s[0] >= threshold]
+    n_unknown = sum(1 for src in sources if labels[src] == "unknown")
+    stats = {
+        "threshold": threshold,
+        "coverage": len(accepted) / len(queries),
+        "unknown_false_accepts": sum(1 for _, ok, unk in accepted if unk and not ok) / max(n_unknown, 1),
+    }
+    print(f"🎯 Retrieval cutoff {threshold:.4f} | coverage {stats['coverage']:.1%} of {len(queries)} held-out queries | "
+          f"unknown mapped to an intent {stats['unknown_false_accepts']:.1%}")
+    return stats
+
+def build_pattern_index(model, tokenizer, texts, labels, out_dir, classes):
+    """
+    Mean-pool the last hidden layer for every pattern and save the
+    L2-normalized matrix next to the model, plus the calibrated cutoff and
+    the label encoder classes it was built against. app.py memory-maps it
+    and pools the same hidden state from the forward pass it already runs.
+    """
+    print("⏳ Building pattern embedding index...")
+    matrix = embed_patterns(model, tokenizer, texts)
+    calibration = calibrate_retrieval(model, tokenizer, texts, labels, matrix)
+
+    np.save(os.path.join(out_dir, INDEX_FILE), matrix)
+    with open(os.path.join(out_dir, INDEX_TAGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(list(labels), f)
+    with open(os.path.join(out_dir, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "top_k": RETRIEVAL_TOP_K,
+            "min_precision": RETRIEVAL_MIN_PRECISION,
+            **calibration,
+            "classes": [str(c) for c in classes],
+        }, f, indent=2)
+    print(f"✅ Indexed {len(texts)} patterns -> {out_dir}/{INDEX_FILE}")
+
+def build_index_only(model_dir):
+    configure_threads()
+    texts, labels = load_patterns()
+    tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
+    with open("label_encoder.pkl", "rb") as f:
+        encoder = pickle.load(f)
+    model = BertForSequenceClassification.from_pretrained(model_dir)
+    model.to(DEVICE)
+    build_pattern_index(model, tokenizer, texts, labels, model_dir, encoder.classes_)
 
-# Save model
-model.save_pretrained("bert_intent_model")
+# ===================================================================
+# 8. EARLY EXIT HEADS
+# ===================================================================
 
-# Save tokenizer
-with open("tokenizer.pkl", "wb") as f:
-    pickle.dump(tokenizer, f)
+EARLY_EXIT_FILE = "early_exit.pt"
+EXIT_TOLERANCE = 0.01  # Max accuracy drop allowed vs. running every layer
+EXIT_HEAD_STEPS = 300
+EXIT_THRESHOLD_GRID = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99]
+
+def layer_features(model, loader):
+    """CLS vector after every encoder layer + final logits, in pattern order"""
+    model.eval()
+    feats, logits, order = [], [], []
+    with torch.no_grad():
+        for batch_idx, batch in zip(loader.batch_sampler, loader):
+            outputs = model(batch["input_ids"].to(DEVICE), attention_mask=batch["attention_mask"].to(DEVICE), output_hidden_states=True)
+            # hidden_states[0] is the embedding output, [l] is after layer l
+            feats.append(torch.stack([h[:, 0] for h in outputs.hidden_states[1:]], dim=1).cpu())
+            logits.append(outputs.logits.cpu())
+            order.extend(batch_idx)
+    inverse = torch.empty(len(order), dtype=torch.long)
+    inverse[torch.tensor(order)] = torch.arange(len(order))
+    return torch.cat(feats)[inverse], torch.cat(logits)[inverse]
+
+def cascade(exit_probs, final_preds, thresholds):
+    """Simulate serving: returns (predictions, layers executed) per example"""
+    n_layers = len(exit_probs) + 1
+    preds = final_preds.clone()
+    layers = torch.full((len(preds),), n_layers, dtype=torch.long)
+    done = torch.zeros(len(preds), dtype=torch.bool)
+    for layer, probs in enumerate(exit_probs, start=1):
+        conf, pred = probs.max(dim=1)
+        hit = (~done) & (conf >= thresholds.get(layer, 1.1))
+        preds[hit] = pred[hit]
+        layers[hit] = layer
+        done |= hit
+    return preds, layers
+
+def train_early_exit(model_dir):
+    """
+    Train a linear head on the CLS state of every intermediate layer (the
+    backbone stays frozen), then calibrate per-layer confidence thresholds
+    greedily so the cascade stays within EXIT_TOLERANCE of the full model.
+    """
+    set_seed(SEED)
+    configure_threads()
+
+    texts, labels = load_patterns()
+    with open("label_encoder.pkl", "rb") as f:
+        encoder = pickle.load(f)
+    y = torch.tensor(encoder.transform(labels), dtype=torch.long)
+    num_classes = len(encoder.classes_)
+
+    tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
+    model = BertForSequenceClassification.from_pretrained(model_dir)
+    model.to(DEVICE)
+
+    # Calibrate on held-out patterns plus their paraphrases, train on the rest
+    train_idx, val_idx = split_holdout(labels)
+    rng = random.Random(SEED)
+    cal_texts, cal_labels = [], []
+    for i in val_idx:
+        for text in [texts[i]] + augment(texts[i], rng):
+            cal_texts.append(text)
+            cal_labels.append(int(y[i]))
+    cal_y = torch.tensor(cal_labels, dtype=torch.long)
+
+    input_ids = tokenize_corpus(texts, tokenizer)
+    cal_ids = tokenize_corpus(cal_texts, tokenizer)
+    pad_id = tokenizer.pad_token_id
+
+    print("⏳ Extracting per-layer features...")
+    feats, _ = layer_features(model, make_loader(input_ids, y.numpy(), shuffle=False, pad_id=pad_id))
+    cal_feats, cal_logits = layer_features(model, make_loader(cal_ids, cal_y.numpy(), shuffle=False, pad_id=pad_id))
+    train_feats, train_y = feats[train_idx], y[train_idx]
+
+    n_layers = feats.shape[1]
+    exit_layers = list(range(1, n_layers))  # The last layer uses the model's own classifier
+    heads = {}
+    loss_fn = torch.nn.CrossEntropyLoss()
+
+    print(f"🚀 Training {len(exit_layers)} exit heads...")
+    for layer in exit_layers:
+        head = torch.nn.Linear(feats.shape[2], num_classes)
+        optimizer = torch.optim.Adam(head.parameters(), lr=1e-3)
+        x = train_feats[:, layer - 1]
+        for _ in range(EXIT_HEAD_STEPS):
+            optimizer.zero_grad()
+            loss = loss_fn(head(x), train_y)
+            loss.backward()
+            optimizer.step()
+        heads[layer] = head
+
+    with torch.no_grad():
+        exit_probs = [torch.softmax(heads[l](cal_feats[:, l - 1]), dim=1) for l in exit_layers]
+    final_preds = cal_logits.argmax(dim=1)
+    full_acc = (final_preds == cal_y).float().mean().item()
+    target = full_acc - EXIT_TOLERANCE
+
+    # Greedy: lowest threshold per layer (shallow first) that keeps accuracy >= target
+    thresholds = {}
+    for layer in exit_layers:
+        for t in EXIT_THRESHOLD_GRID:
+            preds, _ = cascade(exit_probs, final_preds, {**thresholds, layer: t})
+            if (preds == cal_y).float().mean().item() >= target:
+                thresholds[layer] = t
+                break
+
+    preds, layers = cascade(exit_probs, final_preds, thresholds)
+    exit_acc = (preds == cal_y).float().mean().item()
+    avg_layers = layers.float().mean().item()
+
+    torch.save({
+        "fingerprint": model_fingerprint(model_dir, encoder.classes_),
+        "exit_layers": sorted(thresholds),
+        "heads": {l: heads[l].state_dict() for l in thresholds},
+        "thresholds": thresholds,
+        "report": {"full_acc": full_acc, "exit_acc": exit_acc, "avg_layers": avg_layers, "n_layers": n_layers},
+    }, os.path.join(model_dir, EARLY_EXIT_FILE))
+
+    print(f"📊 Full model acc: {full_acc:.4f} | Early-exit acc: {exit_acc:.4f} | Avg layers: {avg_layers:.2f}/{n_layers}")
+    print("   Thresholds: " + ", ".join(f"L{l}={t}" for l, t in sorted(thresholds.items())))
+    print(f"✅ Early-exit heads saved to {model_dir}/{EARLY_EXIT_FILE}")
 
-# Save label encoder
-with open("label_encoder.pkl", "wb") as f:
-    pickle.dump(encoder, f)
+# ===================================================================
+# 9. MAIN
+# ===================================================================
 
-print("✅ Training complete. Files saved:")
-print("   - bert_intent_model/ (Model weights)")
-print("   - tokenizer.pkl (Tokenizer)")
-print("   - label_encoder.pkl (Label mapping)")
+def main():
+    set_seed(SEED)
+    configure_threads()
+
+    print("⏳ Loading and processing data...")
+    texts, labels = load_patterns()
+
+    # Encode labels
+    encoder = LabelEncoder()
+    y = encoder.fit_transform(labels)
+    num_classes = len(encoder.classes_)
+    print(f"✅ Found {len(texts)} patterns and {num_classes} unique tags.")
+
+    tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
+    input_ids = tokenize_corpus(texts, tokenizer)
+
+    pad_id = tokenizer.pad_token_id
+    train_idx, val_idx = split_holdout(labels)
+    train_loader = make_loader([input_ids[i] for i in train_idx], y[train_idx], shuffle=True, pad_id=pad_id)
+    val_loader = make_loader([input_ids[i] for i in val_idx], y[val_idx], shuffle=False, pad_id=pad_id) if val_idx else None
+    print(f"📊 Train: {len(train_idx)} | Held-out: {len(val_idx)}")
+
+    print(f"⏳ Downloading {MODEL_NAME} model...")
+
+    # Pass 1: find how many epochs to train, using the held-out split
+    print("🚀 Pass 1: choosing the epoch count on the held-out split...")
+    model = BertForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=num_classes)
+    model.to(DEVICE)
+    best_epoch, best_loss = train(model, train_loader, val_loader)
+    print(f"🏁 Best held-out loss {best_loss:.4f} at epoch {best_epoch}")
+
+    # Pass 2: retrain from scratch on every pattern (small intents need all of theirs)
+    if val_idx:
+        print(f"🚀 Pass 2: retraining on all {len(texts)} patterns for {best_epoch} epochs...")
+        set_seed(SEED)
+        model = BertForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=num_classes)
+        model.to(DEVICE)
+        train(model, make_loader(input_ids, y, shuffle=True, pad_id=pad_id), None, epochs=best_epoch)
+
+    print("⏳ Saving artifacts...")
+
+    # Save model
+    model.save_pretrained("bert_intent_model")
+
+    # Save tokenizer
+    with open("tokenizer.pkl", "wb") as f:
+        pickle.dump(tokenizer, f)
+
+    # Save label encoder
+    with open("label_encoder.pkl", "wb") as f:
+        pickle.dump(encoder, f)
+
+    # The index and exit heads belong to these weights; rebuild both so none are left stale
+    build_pattern_index(model, tokenizer, texts, labels, "bert_intent_model", encoder.classes_)
+    train_early_exit("bert_intent_model")
+
+    print("✅ Training complete. Files saved:")
+    print("   - bert_intent_model/ (Model weights, pattern index, early-exit heads)")
+    print("   - tokenizer.pkl (Tokenizer)")
+    print("   - label_encoder.pkl (Label mapping)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the GJU intent classifier")
+    parser.add_argument("--distill", action="store_true", help="Distill bert_intent_model into a compact student")
+    parser.add_argument("--build-index", action="store_true", help="Only rebuild the pattern embedding index")
+    parser.add_argument("--early-exit", action="store_true", help="Train and calibrate early-exit heads")
+    parser.add_argument("--model-dir", default=TEACHER_DIR, help="Model directory for --build-index / --early-exit")
+    args = parser.parse_args()
+
+    if args.build_index:
+        build_index_only(args.model_dir)
+    elif args.early_exit:
+        train_early_exit(args.model_dir)
+    elif args.distill:
+        distill()
+    else:
+        main()